@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from database import BookDatabase # Uses the new CSV-based BookDatabase
+from federated_database import FederatedBookDatabase, catalog_paths # One BookDatabase per registered catalog
 import os
 from datetime import datetime
 import math
@@ -160,18 +160,25 @@ st.markdown("""
 
 
 # --- 全局变量和数据库初始化 ---
-DB_FILENAME = "bookCategory.csv"
 try:
     current_dir = os.path.dirname(os.path.realpath(__file__))
-    DB_PATH = os.path.join(current_dir, DB_FILENAME)
-    if not os.path.exists(DB_PATH) and not os.path.isabs(DB_FILENAME):
-        # Fallback for scenarios like running from a different working directory
-        DB_PATH = os.path.join(os.getcwd(), DB_FILENAME)
 except NameError: # __file__ is not defined (e.g. in a Jupyter notebook or interactive console)
-    DB_PATH = os.path.join(os.getcwd(), DB_FILENAME)
+    current_dir = os.getcwd()
+CATALOG_PATHS = catalog_paths(current_dir) # Same registry as app.py: federated_database.CATALOG_FILES
 
-db = BookDatabase(DB_PATH)
+WRITE_BEHIND = True # 增删改先写内存，由后台线程合并后写回CSV，页面无需等待整表重写
+
+@st.cache_resource
+def get_database():
+    # 延迟写入模式需要在各次rerun之间共用同一个实例（及其后台写盘线程）
+    federated_db = FederatedBookDatabase()
+    for catalog_name, csv_path in CATALOG_PATHS.items():
+        federated_db.register(catalog_name, csv_path, write_behind=WRITE_BEHIND)
+    return federated_db
+
+db = get_database()
 ITEMS_PER_PAGE = 10
+SOURCE_COLUMNS = ['catalog'] if len(CATALOG_PATHS) > 1 else [] # 多个目录时显示每本书所在的目录
 
 st.title("📚 图书管理后台")
 
@@ -244,6 +251,12 @@ def pagination_controls(total_items, current_page_session_key, key_suffix=""):
     st.caption(f"当前第 {current_page_val} 页 / 共 {total_pages} 页 (共 {total_items} 条记录)")
     return current_page_val
 
+def read_catalog_csv(catalog_name):
+    """点击下载时才调用：先把该目录尚未写盘的修改写入CSV，再读取文件内容。"""
+    db.catalog(catalog_name).flush()
+    with open(CATALOG_PATHS[catalog_name], "rb") as fp: # Read as bytes
+        return fp.read()
+
 def admin_operations_page():
     with st.sidebar:
         st.markdown("---"); st.markdown(f"### 欢迎, 管理员! 👋")
@@ -264,18 +277,19 @@ def admin_operations_page():
         with col_title:
             st.subheader("所有图书概览")
         with col_download_btn:
+            download_catalog = st.selectbox("下载目录", list(CATALOG_PATHS), key="admin_download_catalog") if len(CATALOG_PATHS) > 1 else next(iter(CATALOG_PATHS))
+            download_path = CATALOG_PATHS[download_catalog]
+            download_filename = os.path.basename(download_path)
             # Check if the CSV file exists before attempting to read it
-            if os.path.exists(DB_PATH):
+            if os.path.exists(download_path):
                 try:
-                    with open(DB_PATH, "rb") as fp: # Read as bytes
-                        btn_data = fp.read()
                     st.download_button(
                         label="💾 保存CSV文件",
-                        data=btn_data,
-                        file_name=DB_FILENAME, # e.g., "bookCategory.csv"
+                        data=lambda catalog_name=download_catalog: read_catalog_csv(catalog_name), # Deferred: only flushes and reads when clicked
+                        file_name=download_filename, # e.g., "bookCategory.csv"
                         mime="text/csv",
                         key="admin_download_csv_button",
-                        help=f"点击下载最新的图书数据 ({DB_FILENAME})。",
+                        help=f"点击下载最新的图书数据 ({download_filename})。",
                         use_container_width=True,
                         type="primary" # Makes the button more prominent
                     )
@@ -283,7 +297,7 @@ def admin_operations_page():
                     st.error(f"无法读取CSV文件进行下载: {e}")
             else:
                 # Optionally, display a message or a disabled button if file doesn't exist
-                st.caption(f"{DB_FILENAME} 尚不存在。")
+                st.caption(f"{download_filename} 尚不存在。")
         # --- END OF MODIFICATION ---
 
         if 'browse_current_page_admin' not in st.session_state: st.session_state.browse_current_page_admin = 1
@@ -296,7 +310,7 @@ def admin_operations_page():
             display_df_browse.index = pd.RangeIndex(start=start_global_index, stop=start_global_index + len(display_df_browse))
             display_df_browse.index.name = "序号"
 
-            display_cols_browse = ['bookorder', 'indexnumber', 'bookname', 'author', 'publishdepartment', 'price', 'publishdate']
+            display_cols_browse = SOURCE_COLUMNS + ['bookorder', 'indexnumber', 'bookname', 'author', 'publishdepartment', 'price', 'publishdate']
             display_cols_browse_present = [col for col in display_cols_browse if col in display_df_browse.columns]
             st.dataframe(display_df_browse[display_cols_browse_present], use_container_width=True)
             pagination_controls(total_books, 'browse_current_page_admin', key_suffix="browse_admin")
@@ -317,6 +331,7 @@ def admin_operations_page():
             st.session_state.add_book_success = False # Reset after displaying
 
         with st.form("add_book_form_admin", clear_on_submit=True):
+            target_catalog = st.selectbox("添加到目录 *", list(CATALOG_PATHS), key="add_catalog_admin_v2") if len(CATALOG_PATHS) > 1 else next(iter(CATALOG_PATHS))
             col1, col2 = st.columns(2)
             with col1:
                 book_order = st.text_input("图书编号 (Book Order) *", key="add_bo_admin_v2", placeholder="例如: A001-2023")
@@ -354,7 +369,7 @@ def admin_operations_page():
                         "month": int(publish_month) if publish_month is not None else None
                     }
                     try:
-                        db.add_book(book_data)
+                        db.add_book(book_data, catalog=target_catalog)
                         st.session_state.add_book_success = True
                         st.session_state.add_book_message = f"🎉 图书《{book_name.strip()}》添加成功！"
                          # Reset browse page to 1 so user can see the new book if added to the first page
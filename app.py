@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from database import BookDatabase
+from federated_database import FederatedBookDatabase, catalog_paths
 import os
 from datetime import datetime
 import math
@@ -62,28 +62,106 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-DB_FILENAME = "bookCategory.csv"
 try:
     current_dir = os.path.dirname(os.path.realpath(__file__))
-    DB_PATH = os.path.join(current_dir, DB_FILENAME)
-    if not os.path.exists(DB_PATH) and not os.path.isabs(DB_FILENAME):
-        DB_PATH = os.path.join(os.getcwd(), DB_FILENAME)
 except NameError:
-    DB_PATH = os.path.join(os.getcwd(), DB_FILENAME)
+    current_dir = os.getcwd()
+CATALOG_PATHS = catalog_paths(current_dir) # 目录清单在 federated_database.CATALOG_FILES 中配置
 
-db = BookDatabase(DB_PATH)
+SHARED_SNAPSHOT = False # 多个Streamlit进程部署时设为True，各进程共用一份只读的目录快照（见 shared_catalog.py）
+
+@st.cache_resource
+def get_database():
+    # 每个进程只保留一个实例；每次查询前会检查CSV是否变化（共享模式下检查是否有新一代快照）
+    federated_db = FederatedBookDatabase()
+    for catalog_name, csv_path in CATALOG_PATHS.items():
+        federated_db.register(catalog_name, csv_path, shared_snapshot=SHARED_SNAPSHOT)
+    return federated_db
+
+db = get_database()
 ITEMS_PER_PAGE = 15
+SORT_OPTIONS = {"按相关度": "relevance", "按入库顺序": "id"}
+SOURCE_COLUMNS = ['catalog'] if len(CATALOG_PATHS) > 1 else [] # 多个目录时显示每条结果来自哪个目录
 
 def init_session_state():
     if 'query_conditions' not in st.session_state: st.session_state.query_conditions = {}
     if 'search_results' not in st.session_state: st.session_state.search_results = pd.DataFrame()
     if 'current_page' not in st.session_state: st.session_state.current_page = 1
     if 'total_results' not in st.session_state: st.session_state.total_results = 0
+    if 'sort_by' not in st.session_state: st.session_state.sort_by = 'relevance'
+    if 'shelf_range' not in st.session_state: st.session_state.shelf_range = {}
+    if 'shelf_page' not in st.session_state: st.session_state.shelf_page = 1
+
+def shelf_browse_section():
+    """按索书号（中图法分类号）浏览书架，可按分类号前缀（如 H164）或区间（如 H1 至 H2）查看。"""
+    with st.form("shelf_form"):
+        st.markdown("<h2 class='search-subheader'>📚 按索书号浏览</h2>", unsafe_allow_html=True)
+        cols_inputs = st.columns(3)
+        with cols_inputs[0]: prefix_input = st.text_input("分类号前缀", value=st.session_state.shelf_range.get('prefix', ''), placeholder="例如: H164", key="shelf_prefix_input")
+        with cols_inputs[1]: start_input = st.text_input("起始分类号", value=st.session_state.shelf_range.get('start', ''), placeholder="例如: H1", key="shelf_start_input")
+        with cols_inputs[2]: end_input = st.text_input("结束分类号（含）", value=st.session_state.shelf_range.get('end', ''), placeholder="例如: H2", key="shelf_end_input")
+        browse_submitted = st.form_submit_button("按书架顺序浏览", use_container_width=True)
+
+    if browse_submitted:
+        st.session_state.shelf_range = {'prefix': prefix_input.strip(), 'start': start_input.strip(), 'end': end_input.strip()}
+        st.session_state.shelf_page = 1
+
+    shelf_range = st.session_state.shelf_range
+    if not any(shelf_range.values()):
+        st.info("💡 请输入分类号前缀或分类号区间，按书架顺序浏览图书。")
+        return
+
+    current_offset = (st.session_state.shelf_page - 1) * ITEMS_PER_PAGE
+    results_df, total_count = db.browse_by_callnumber(
+        prefix=shelf_range.get('prefix'), start=shelf_range.get('start'), end=shelf_range.get('end'),
+        limit=ITEMS_PER_PAGE, offset=current_offset
+    )
+    if results_df.empty:
+        st.info("🤷‍♀️ 该索书号范围内没有图书。")
+        return
+
+    st.markdown("<h2 class='results-subheader'>📖 书架浏览结果</h2>", unsafe_allow_html=True)
+    display_df = results_df.copy()
+    display_df.index = pd.RangeIndex(start=current_offset + 1, stop=current_offset + 1 + len(display_df))
+    display_df.index.name = "序号"
+    display_columns = SOURCE_COLUMNS + ['indexnumber', 'bookorder', 'bookname', 'author', 'publishdepartment', 'price', 'publishdate']
+    st.dataframe(display_df[[col for col in display_columns if col in display_df.columns]], use_container_width=True)
+
+    total_pages = max(1, math.ceil(total_count / ITEMS_PER_PAGE))
+    st.caption(f"共 {total_count} 条记录，当前显示第 {st.session_state.shelf_page} / {total_pages} 页")
+    if total_pages > 1:
+        nav_cols = st.columns((1, 1, 0.2, 1, 1))
+        with nav_cols[0]:
+            if st.button("⏪ 首页", key="shelf_first_page", disabled=st.session_state.shelf_page == 1, use_container_width=True):
+                st.session_state.shelf_page = 1; st.rerun()
+        with nav_cols[1]:
+            if st.button("◀️ 上一页", key="shelf_prev_page", disabled=st.session_state.shelf_page == 1, use_container_width=True):
+                st.session_state.shelf_page -= 1; st.rerun()
+        with nav_cols[3]:
+            if st.button("▶️ 下一页", key="shelf_next_page", disabled=st.session_state.shelf_page == total_pages, use_container_width=True):
+                st.session_state.shelf_page += 1; st.rerun()
+        with nav_cols[4]:
+            if st.button("⏩ 末页", key="shelf_last_page", disabled=st.session_state.shelf_page == total_pages, use_container_width=True):
+                st.session_state.shelf_page = total_pages; st.rerun()
+
+def render_footer():
+    st.markdown("""
+    <div class="footer">
+        <p>Copyright © 2025-长期 版权所有：华中师大语言研究所</p>
+        <p>本检索系统由沈威制作，在使用中如果有任何问题可以发邮件至：<a href="mailto:sw@ccnu.edu.cn">sw@ccnu.edu.cn</a></p>
+    </div>
+    """, unsafe_allow_html=True)
 
 def book_query_page():
     init_session_state()
     st.markdown("<h1><span style='font-weight:300;'>语言研究所资料室</span><br>图书查询系统</h1>", unsafe_allow_html=True)
 
+    query_mode = st.radio("查询方式", ["条件查询", "按索书号浏览"], horizontal=True, key="query_mode", label_visibility="collapsed")
+    if query_mode == "按索书号浏览":
+        shelf_browse_section()
+        render_footer()
+        return
+
     with st.form("search_form"):
         st.markdown("<h2 class='search-subheader'>🔍 搜书导航</h2>", unsafe_allow_html=True)
         cols_inputs = st.columns([2, 2, 2, 1])
@@ -104,7 +182,20 @@ def book_query_page():
                 step=1, value=default_year_val, 
                 format="%d", placeholder="YYYY", key="year_input"
             )
+
+        cols_ranges = st.columns(4)
+        with cols_ranges[0]: price_min_search = st.number_input("最低价格", min_value=0.0, value=st.session_state.query_conditions.get('price_min'), format="%.2f", placeholder="不限", key="price_min_input")
+        with cols_ranges[1]: price_max_search = st.number_input("最高价格", min_value=0.0, value=st.session_state.query_conditions.get('price_max'), format="%.2f", placeholder="不限", key="price_max_input")
+        with cols_ranges[2]: date_from_search = st.text_input("出版日期起", value=st.session_state.query_conditions.get('date_from') or '', placeholder="YYYY 或 YYYY-MM", key="date_from_input")
+        with cols_ranges[3]: date_to_search = st.text_input("出版日期止", value=st.session_state.query_conditions.get('date_to') or '', placeholder="YYYY 或 YYYY-MM", key="date_to_input")
         
+        sort_labels = list(SORT_OPTIONS)
+        sort_label = st.radio(
+            "排序方式", sort_labels,
+            index=list(SORT_OPTIONS.values()).index(st.session_state.sort_by),
+            horizontal=True, key="sort_input"
+        )
+
         st.markdown("<br>", unsafe_allow_html=True)
         
         spacer_ratio = 1.5 
@@ -118,21 +209,28 @@ def book_query_page():
             clear_submitted = st.form_submit_button("清空所有", use_container_width=True, type="secondary")
 
     if clear_submitted:
-        st.session_state.query_conditions = {'bookname': '', 'author': '', 'publishdepartment': '', 'year': None}
+        st.session_state.query_conditions = {'bookname': '', 'author': '', 'publishdepartment': '', 'year': None, 'price_min': None, 'price_max': None, 'date_from': '', 'date_to': ''}
         st.session_state.search_results = pd.DataFrame()
         st.session_state.total_results = 0
         st.session_state.current_page = 1
+        st.session_state.sort_by = 'relevance'
         st.rerun()
 
     if search_submitted:
-        st.session_state.query_conditions = {'bookname': book_name_search.strip(), 'author': author_search.strip(), 'publishdepartment': publisher_search.strip(), 'year': str(publish_year_search).strip() if publish_year_search is not None else None}
+        st.session_state.query_conditions = {'bookname': book_name_search.strip(), 'author': author_search.strip(), 'publishdepartment': publisher_search.strip(), 'year': str(publish_year_search).strip() if publish_year_search is not None else None,
+                                             'price_min': price_min_search, 'price_max': price_max_search, 'date_from': date_from_search.strip(), 'date_to': date_to_search.strip()}
+        st.session_state.sort_by = SORT_OPTIONS[sort_label]
         st.session_state.current_page = 1
     
     active_conditions = {k: v for k, v in st.session_state.query_conditions.items() if v is not None and str(v).strip() != ''}
 
     if active_conditions:
         current_offset = (st.session_state.current_page - 1) * ITEMS_PER_PAGE
-        results_df, total_count = db.search_books(active_conditions, limit=ITEMS_PER_PAGE, offset=current_offset)
+        try:
+            results_df, total_count = db.search_books(active_conditions, limit=ITEMS_PER_PAGE, offset=current_offset, sort_by=st.session_state.sort_by)
+        except ValueError as ve:
+            st.warning(f"⚠️ {ve}")
+            results_df, total_count = pd.DataFrame(), 0
         st.session_state.search_results = results_df
         st.session_state.total_results = total_count
 
@@ -142,7 +240,7 @@ def book_query_page():
             start_global_index = current_offset + 1
             display_df.index = pd.RangeIndex(start=start_global_index, stop=start_global_index + len(display_df))
             display_df.index.name = "序号"
-            display_columns = ['bookorder', 'indexnumber', 'bookname', 'author', 'publishdepartment', 'price', 'publishdate']
+            display_columns = SOURCE_COLUMNS + ['bookorder', 'indexnumber', 'bookname', 'author', 'publishdepartment', 'price', 'publishdate']
             display_columns_present = [col for col in display_columns if col in display_df.columns]
             
             # 移除固定的高度设置，以防止页面出现主滚动条
@@ -178,12 +276,7 @@ def book_query_page():
         st.info("💡 请输入查询条件以查找图书。例如，输入作者名或书名的一部分。")
     
     # --- 新增的页脚 ---
-    st.markdown("""
-    <div class="footer">
-        <p>Copyright © 2025-长期 版权所有：华中师大语言研究所</p>
-        <p>本检索系统由沈威制作，在使用中如果有任何问题可以发邮件至：<a href="mailto:sw@ccnu.edu.cn">sw@ccnu.edu.cn</a></p>
-    </div>
-    """, unsafe_allow_html=True)
+    render_footer()
 
 
 def main():
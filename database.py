@@ -1,27 +1,167 @@
 import pandas as pd
+import numpy as np
+import io
 import os
+import re
+import json
+import time
+import pickle
+import bisect
+import hashlib
+import atexit
+import functools
+import threading
 from datetime import datetime
 import uuid # For generating unique IDs if needed, though we'll try sequential int
 
+
+def _synchronized(method):
+    """在实例锁内执行方法，保证后台刷盘线程与页面线程互不干扰（用于修改；读操作见 _read_view）。"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _char_ngrams(text, n=2):
+    """把查询词切成字符n-gram（中文书名没有空格分词，按字切分更稳妥）；不足n个字时返回整个词。"""
+    if len(text) <= n:
+        return [text]
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def _normalize_callnumber(value):
+    """把索书号规范成可按书架顺序比较的键：去空格、转大写，并把分隔种次号的 '/' 换成
+    比 '-'、'.'、数字都小的字符，使 H164/WL 排在 H164-53、H164.3 之前。"""
+    return str(value).replace(' ', '').upper().replace('/', '!')
+
+
+def _is_set(value):
+    """查询条件是否填写（None、空字符串和NaN都视为未填写）。"""
+    if value is None:
+        return False
+    if isinstance(value, float) and np.isnan(value):
+        return False
+    return str(value).strip() != ''
+
+
+def _parse_month_bound(value, is_end):
+    """把出版日期区间的一端（1990、1990-5、1990/05、1990年5月）换算成 年*100+月。
+
+    只写年份时，起点取该年0月（包括只记录了年份的图书），终点取该年12月。
+    """
+    match = re.match(r'^\s*(\d{4})\s*(?:[-/.年]\s*(\d{1,2})\s*月?)?\s*$', str(value))
+    if not match:
+        raise ValueError(f"无效的出版日期: {value}（应为 YYYY 或 YYYY-MM）")
+    year = int(match.group(1))
+    if match.group(2):
+        month = int(match.group(2))
+        if not (1 <= month <= 12):
+            raise ValueError("月份必须在1到12之间")
+    else:
+        month = 12 if is_end else 0
+    return year * 100 + month
+
+
+def _top_k_positions(scores, ids, k):
+    """按得分从高到低（同分按id升序）返回前k行的位置，只对候选行排序而不是全量排序。"""
+    if k <= 0 or len(scores) == 0:
+        return np.array([], dtype=int)
+    if k < len(scores):
+        # Partial selection: find the k-th best score, then keep every row tied with it
+        # so that the ordering of ties (and therefore pagination) stays deterministic.
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((ids[candidates], -scores[candidates]))
+    return candidates[order][:k]
+
+
 class BookDatabase:
-    def __init__(self, csv_file_path):
+    # 相关度排序时各字段的权重，书名命中最重要
+    RELEVANCE_FIELD_WEIGHTS = {'bookname': 3.0, 'author': 2.0, 'publishdepartment': 1.0}
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    SELECTIVITY_SAMPLE_SIZE = 256 # 估计谓词选择性时抽样的行数
+    SNAPSHOT_VERSION = 3 # 快照格式或清洗逻辑变化时递增，使旧快照失效
+    FLUSH_RETRY_INITIAL = 0.5 # 后台写盘失败后第一次重试前等待的秒数，之后每次翻倍
+    FLUSH_RETRY_MAX = 60.0 # 重试间隔的上限
+
+    def __init__(self, csv_file_path, write_behind=False, flush_delay=0.5, max_flush_delay=5.0, use_snapshot=True,
+                 shared_snapshot=False, shared_dir=None):
         """初始化数据库，使用CSV文件作为数据存储。
 
         Args:
             csv_file_path (str): CSV文件的完整路径。
+            write_behind (bool): 是否启用延迟写入模式。启用后增删改只修改内存数据，
+                并追加到待写日志（``<csv>.pending``），由后台线程合并后统一写回CSV。
+            flush_delay (float): 最后一次修改后静默多少秒再写盘，用于合并连续的修改。
+            max_flush_delay (float): 第一次未写盘的修改最多等待多少秒必须写盘。
+            use_snapshot (bool): 是否使用二进制快照（``<csv>.snapshot``）缓存清洗后的数据。
+                CSV未变化时直接反序列化快照，跳过 read_csv 和列清洗。
+            shared_snapshot (bool): 是否启用多进程共享模式。数据以只读的 Arrow 快照发布到共享内存，
+                各进程映射同一份快照而不是各自持有一份（见 shared_catalog.py，需要 pyarrow）。
+            shared_dir (str): 共享快照所在目录，默认放在 /dev/shm 下。
         """
         self.csv_file_path = csv_file_path
         print(f"[DEBUG] BookDatabase initialized with path: {self.csv_file_path}") # DEBUG
         self.columns = ['id', 'bookorder', 'indexnumber', 'bookname', 'author', 
                         'publishdepartment', 'price', 'publishdate', 'isdelete']
-        self.df = self._load_data()
+        self.write_behind = write_behind
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        self.pending_path = f"{csv_file_path}.pending"
+        self.use_snapshot = use_snapshot
+        self.snapshot_path = f"{csv_file_path}.snapshot"
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock() # Serializes CSV rewrites
+        self._pending_changed = threading.Condition(self._lock)
+        self._dirty = False
+        self._pending_bytes = 0 # Size of the pending journal not yet reflected in the CSV
+        self._first_pending_at = 0.0
+        self._last_change_at = 0.0
+        self._retry_at = 0.0 # Earliest time the flush thread may retry after a failed flush
+        self._retry_delay = 0.0
+        self._stopping = False
+        self._flush_thread = None
+
+        self.shared = None
+        self._shared_generation = None # Generation currently mapped, None when self.df is private
+        if shared_snapshot:
+            from shared_catalog import SharedCatalog # Optional: needs pyarrow
+            self.shared = SharedCatalog(csv_file_path, shared_dir)
+
+        self._loaded_signature = self._csv_signature()
+        if self.shared is not None:
+            self._refresh_from_shared()
+        else:
+            self.df = self._load_data()
+
+        if self.write_behind:
+            self._recover_pending()
+            self._flush_thread = threading.Thread(target=self._flush_worker, name="BookDatabaseFlush", daemon=True)
+            self._flush_thread.start()
+            atexit.register(self.close)
 
     def _load_data(self):
         """加载CSV文件数据，如果文件不存在则创建一个空的DataFrame。"""
         print(f"[DEBUG] _load_data: Attempting to load {self.csv_file_path}") # DEBUG
+        self._indexes = {} # Rebuilt lazily unless restored from the snapshot below
         if os.path.exists(self.csv_file_path):
             try:
-                df = pd.read_csv(self.csv_file_path, dtype={'bookorder': str, 'indexnumber': str}) # Specify some dtypes
+                signature = self._csv_signature()
+                snapshot = self._load_snapshot(signature)
+                if snapshot is not None:
+                    df, self._indexes = snapshot
+                    return df
+
+                parse_started = time.perf_counter()
+                with open(self.csv_file_path, 'rb') as f:
+                    raw = f.read() # Parse the exact bytes that get hashed into the snapshot
+                df = pd.read_csv(io.BytesIO(raw), dtype={'bookorder': str, 'indexnumber': str}) # Specify some dtypes
                 print(f"[DEBUG] _load_data: CSV loaded successfully. Shape: {df.shape}") # DEBUG
                 if not df.empty:
                     print("[DEBUG] _load_data: CSV head:\n", df.head()) # DEBUG
@@ -61,7 +201,10 @@ class BookDatabase:
                     if col_name in df.columns:
                         df[col_name] = df[col_name].astype(str).fillna('') # Convert to string, fill NaN with empty string
 
-                return df[self.columns] # Ensure column order
+                df = df[self.columns] # Ensure column order
+                self._indexes = self._create_indexes(df)
+                self._save_snapshot(df, self._indexes, signature, raw, time.perf_counter() - parse_started)
+                return df
             except pd.errors.EmptyDataError:
                 print(f"[DEBUG] _load_data: CSV file {self.csv_file_path} is empty.") # DEBUG
                 return pd.DataFrame(columns=self.columns)
@@ -78,106 +221,573 @@ class BookDatabase:
             })
             return df
 
-    def _save_data(self):
-        """保存DataFrame数据到CSV文件。"""
+    def _load_snapshot(self, signature):
+        """CSV未变化时从二进制快照加载清洗后的数据和索引，返回 (df, indexes)；快照缺失或失效时返回None。
+
+        先比较文件大小；大小一致且修改时间一致即视为有效，修改时间不同（如重新拷贝、
+        git checkout）时再比较内容的SHA-256。
+        """
+        if not self.use_snapshot or signature is None or not os.path.exists(self.snapshot_path):
+            return None
+        started = time.perf_counter()
         try:
-            # Ensure correct types before saving
-            if not self.df.empty:
-                self.df['id'] = self.df['id'].astype(int)
-                self.df['isdelete'] = self.df['isdelete'].astype(int)
-                if 'price' in self.df.columns:
-                    self.df['price'] = pd.to_numeric(self.df['price'], errors='coerce')
-            
-            self.df.to_csv(self.csv_file_path, index=False, encoding='utf-8-sig')
+            with open(self.snapshot_path, 'rb') as f:
+                meta = pickle.load(f)
+                if (meta.get('version') != self.SNAPSHOT_VERSION or meta.get('pandas') != pd.__version__
+                        or meta.get('columns') != self.columns or meta.get('csv_size') != signature[1]):
+                    print(f"[DEBUG] _load_snapshot: Snapshot {self.snapshot_path} is stale, re-parsing CSV.") # DEBUG
+                    return None
+                if meta.get('csv_mtime_ns') != signature[0]:
+                    with open(self.csv_file_path, 'rb') as csv_f:
+                        if hashlib.sha256(csv_f.read()).hexdigest() != meta.get('csv_sha256'):
+                            print(f"[DEBUG] _load_snapshot: Snapshot {self.snapshot_path} is stale, re-parsing CSV.") # DEBUG
+                            return None
+                df = pickle.load(f)
+                indexes = pickle.load(f)
+        except Exception as e:
+            print(f"[WARN] _load_snapshot: Could not read snapshot {self.snapshot_path}: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        saved = meta.get('parse_seconds', 0.0) - elapsed
+        print(f"[INFO] _load_snapshot: Loaded {len(df)} rows from snapshot in {elapsed * 1000:.1f} ms "
+              f"(CSV parse took {meta.get('parse_seconds', 0.0) * 1000:.1f} ms, saved {saved * 1000:.1f} ms)")
+        return df, indexes
+
+    def _save_snapshot(self, df, indexes, signature, raw, parse_seconds):
+        """把清洗后的数据和索引连同CSV的大小、修改时间和SHA-256写入快照文件。"""
+        if not self.use_snapshot or signature is None:
+            return
+        meta = {
+            'version': self.SNAPSHOT_VERSION,
+            'pandas': pd.__version__,
+            'columns': self.columns,
+            'csv_size': signature[1],
+            'csv_mtime_ns': signature[0],
+            'csv_sha256': hashlib.sha256(raw).hexdigest(),
+            'parse_seconds': parse_seconds,
+        }
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                # Metadata first, so validation does not have to unpickle the whole frame
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(indexes, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+            print(f"[DEBUG] _save_snapshot: Snapshot written to {self.snapshot_path}") # DEBUG
+        except Exception as e:
+            print(f"[WARN] _save_snapshot: Could not write snapshot {self.snapshot_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _csv_signature(self):
+        """返回CSV文件的 (修改时间, 大小)，文件不存在时返回None。"""
+        try:
+            stat = os.stat(self.csv_file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh_data(self):
+        """从CSV重新加载数据；文件自上次加载后没有变化时直接复用内存数据。
+
+        延迟写入模式下若有未写盘的修改，则以内存数据为准。
+        """
+        if self.write_behind and self._dirty:
+            return
+        if self.shared is not None:
+            self._refresh_from_shared()
+            return
+        # Take the signature before reading so a write racing with the load triggers another reload
+        signature = self._csv_signature()
+        if signature is not None and signature == self._loaded_signature:
+            return
+        self.df = self._load_data()
+        self._loaded_signature = signature
+
+    def _refresh_from_shared(self):
+        """共享模式下的刷新：CSV未变化时切换到最新一代共享快照；CSV变化后由本进程重新加载并发布新一代。"""
+        signature = self._csv_signature()
+        if signature is None: # Nothing to share yet
+            self.df = self._load_data()
+            return
+        for attempt in range(2):
+            generation, published_signature = self.shared.current()
+            indexes = {}
+            if generation is None or published_signature != signature:
+                with self.shared.publish_lock():
+                    generation, published_signature = self.shared.current()
+                    if generation is None or published_signature != signature: # Nobody published it meanwhile
+                        df = self._load_data()
+                        generation = self.shared.publish(df, signature)
+                        indexes = self._indexes # Same rows in the same order as the published copy
+            if generation == self._shared_generation:
+                return
+            try:
+                self.df = self.shared.open(generation)
+            except FileNotFoundError:
+                continue # Superseded and removed between reading CURRENT and mapping it
+            self._indexes = indexes
+            self._shared_generation = generation
+            self._loaded_signature = signature
+            return
+        print("[WARN] _refresh_from_shared: Shared snapshot kept changing, loading a private copy.")
+        self.df = self._load_data()
+        self._shared_generation = None
+
+    def _make_writable(self):
+        """共享模式下的数据是只读映射，修改前先复制一份本进程私有的数据。"""
+        if self._shared_generation is not None:
+            self.df = self.df.copy()
+            self._shared_generation = None
+
+    def _save_data(self, df=None):
+        """保存DataFrame数据到CSV文件（默认保存 self.df）。"""
+        if df is None:
+            df = self.df
+        # Ensure correct types before saving
+        if not df.empty:
+            df['id'] = df['id'].astype(int)
+            df['isdelete'] = df['isdelete'].astype(int)
+            if 'price' in df.columns:
+                df['price'] = pd.to_numeric(df['price'], errors='coerce')
+        self._write_csv(df)
+
+    def _write_csv(self, df):
+        """把给定的DataFrame原子地写入CSV（先写临时文件再替换），读者不会读到半个文件。"""
+        tmp_path = f"{self.csv_file_path}.tmp"
+        try:
+            df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+            os.replace(tmp_path, self.csv_file_path)
+            # self.df already holds what was just written, so the next read should not re-parse it
+            self._loaded_signature = self._csv_signature()
             print(f"[DEBUG] _save_data: Data saved to {self.csv_file_path}") # DEBUG
         except Exception as e:
             print(f"[ERROR] _save_data: Error saving CSV {self.csv_file_path}: {e}") # ERROR
             raise
 
+    def _commit(self, op, new_df, **payload):
+        """提交一次修改：同步模式立即写CSV，延迟写入模式追加待写日志后交给后台线程。
+
+        ``new_df`` 是修改后的数据副本，持久化成功后才替换 self.df；写CSV或日志失败时
+        内存数据保持不变，调用方收到异常，不会出现“报错但内存里已经改了”的情况。
+        """
+        if not self.write_behind:
+            self._save_data(new_df)
+            self.df = new_df
+            self._indexes = {} # Any change may move a book on or off the shelf order
+            return
+
+        line = json.dumps({'op': op, **payload}, ensure_ascii=False) + "\n"
+        data = line.encode('utf-8')
+        with open(self.pending_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno()) # The journal is what survives a crash, so make it durable
+        self.df = new_df
+        self._indexes = {}
+        now = time.monotonic()
+        if not self._dirty:
+            self._first_pending_at = now
+        self._last_change_at = now
+        self._pending_bytes += len(data)
+        self._dirty = True
+        self._pending_changed.notify_all()
+
+    def _apply_change(self, entry):
+        """把一条待写日志记录重放到内存数据上（用于崩溃恢复，重复重放是安全的）。"""
+        self._indexes = {}
+        op = entry.get('op')
+        if op == 'add':
+            if not (self.df['id'] == int(entry['row']['id'])).any():
+                self.df = self._append_row(self.df, entry['row'])
+        elif op in ('update', 'delete'):
+            idx_series = self.df[self.df['id'] == int(entry['id'])].index
+            if idx_series.empty:
+                print(f"[WARN] _apply_change: Book id {entry['id']} not found, skipping '{op}'.")
+                return
+            values = entry['values'] if op == 'update' else {'isdelete': 1}
+            for col, value in values.items():
+                self.df.loc[idx_series[0], col] = value
+        else:
+            print(f"[WARN] _apply_change: Unknown pending operation {op!r}, skipping.")
+
+    def _recover_pending(self):
+        """启动时检查上次遗留的待写日志，把其中的修改补写进CSV。"""
+        if not os.path.exists(self.pending_path):
+            return
+        entries = []
+        with open(self.pending_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash in the middle of an append leaves a torn last line
+                    print(f"[WARN] _recover_pending: Ignoring truncated entry in {self.pending_path}")
+                    break
+        print(f"[DEBUG] _recover_pending: Replaying {len(entries)} pending change(s) from {self.pending_path}") # DEBUG
+        self._make_writable()
+        for entry in entries:
+            self._apply_change(entry)
+        self._save_data()
+        os.remove(self.pending_path)
+
+    def _flush_worker(self):
+        """后台写盘线程：等修改停顿 ``flush_delay`` 秒（最长 ``max_flush_delay`` 秒）后合并写盘。"""
+        while True:
+            with self._lock:
+                while not self._dirty and not self._stopping:
+                    self._pending_changed.wait()
+                if not self._dirty:
+                    return
+                while not self._stopping:
+                    deadline = max(min(self._last_change_at + self.flush_delay,
+                                       self._first_pending_at + self.max_flush_delay),
+                                   self._retry_at)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_changed.wait(remaining)
+            try:
+                self.flush()
+            except Exception as e:
+                with self._lock:
+                    # Back off exponentially so a persistent failure (disk full, CSV locked) does not spin
+                    self._retry_delay = min(max(self._retry_delay * 2, self.FLUSH_RETRY_INITIAL), self.FLUSH_RETRY_MAX)
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    print(f"[ERROR] _flush_worker: Background flush failed, retrying in {self._retry_delay:.1f}s: {e}") # ERROR
+                    if self._stopping:
+                        return
+            else:
+                with self._lock:
+                    self._retry_delay = 0.0
+                    self._retry_at = 0.0
+
+    def flush(self):
+        """立即把内存中尚未写盘的修改写入CSV。
+
+        Returns:
+            bool: 是否实际执行了写盘。
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                snapshot = self.df.copy()
+                flushed_bytes = self._pending_bytes
+            # The CSV rewrite happens outside the lock so edits are not blocked by it
+            if not snapshot.empty:
+                snapshot['id'] = snapshot['id'].astype(int)
+                snapshot['isdelete'] = snapshot['isdelete'].astype(int)
+                snapshot['price'] = pd.to_numeric(snapshot['price'], errors='coerce')
+            self._write_csv(snapshot)
+            with self._lock:
+                # Drop only the journal entries covered by the snapshot; later edits stay pending
+                try:
+                    with open(self.pending_path, 'rb') as f:
+                        f.seek(flushed_bytes)
+                        rest = f.read()
+                except FileNotFoundError:
+                    rest = b''
+                if rest:
+                    tmp_path = f"{self.pending_path}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(rest)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.pending_path)
+                    self._first_pending_at = time.monotonic()
+                elif os.path.exists(self.pending_path):
+                    os.remove(self.pending_path)
+                self._pending_bytes = len(rest)
+                self._dirty = bool(rest)
+            return True
+
     def connect(self):
         pass 
 
     def close(self):
-        pass 
+        """停止后台写盘线程，并把尚未写盘的修改写入CSV。"""
+        if not self.write_behind:
+            return
+        with self._lock:
+            self._stopping = True
+            self._pending_changed.notify_all()
+        if self._flush_thread is not None and self._flush_thread is not threading.current_thread():
+            self._flush_thread.join()
+        self.flush()
 
-    def _create_indexes(self):
-        pass 
+    def _create_indexes(self, df):
+        """为数据建立索引。
+
+        Returns:
+            dict: 'callnumber' 为按书架顺序排列的索书号索引 (keys, positions)，keys 为规范化后
+            升序排列的索书号，positions 为对应行在 df 中的位置，只包含未删除且有索书号的图书；
+            'publish_month' 为每一行出版日期换算成的 年*100+月 整数（只有年份时月为0，无法解析为-1）。
+        """
+        active = df[(df['isdelete'] == 0)]
+        keys = active['indexnumber'].astype(str).map(_normalize_callnumber)
+        has_callnumber = ~keys.isin(['', 'NAN', 'NONE'])
+        shelf = pd.DataFrame({
+            'key': keys[has_callnumber],
+            'id': active.loc[has_callnumber, 'id'],
+            'position': np.flatnonzero((df['isdelete'] == 0).to_numpy())[has_callnumber.to_numpy()],
+        }).sort_values(['key', 'id'], kind='stable')
+        dates = df['publishdate'].astype(str).str.extract(r'^\s*(\d{4})\s*年\s*(?:(\d{1,2})\s*月)?')
+        years = pd.to_numeric(dates[0], errors='coerce')
+        months = pd.to_numeric(dates[1], errors='coerce').fillna(0)
+        publish_months = (years * 100 + months).fillna(-1).astype(np.int64).to_numpy()
+        return {
+            'callnumber': (shelf['key'].tolist(), shelf['position'].to_numpy()),
+            'publish_month': publish_months,
+        }
 
-    def search_books(self, conditions, limit=15, offset=0):
+    def _read_view(self):
+        """在实例锁内刷新数据，返回当前的 (df, indexes)。
+
+        修改总是先生成新的DataFrame再整体替换 self.df，索引字典也随之换新（见 _commit），
+        因此读操作拿到这一对引用后可以在锁外计算，多个查询线程可以同时执行。
+        """
+        with self._lock:
+            self._refresh_data()
+            return self.df, self._indexes
+
+    def _get_index(self, df, indexes, name):
+        """取得 df 的指定索引，数据变化后索引被清空时先重建（重建结果存回 indexes）。"""
+        if name not in indexes:
+            indexes.update(self._create_indexes(df)) # Two threads may both build it; the results are identical
+        return indexes[name]
+
+    def _callnumber_range(self, df, indexes, prefix=None, start=None, end=None):
+        """用二分查找在索书号索引中定位范围，返回该范围内行的位置（按书架顺序）。
+
+        ``prefix`` 匹配以该分类号开头的所有索书号（如 H164 包括 H164/LZF、H164.3）；
+        ``start``/``end`` 为闭区间，两端都按前缀理解（H1 到 H2 包括 H2 下的所有子类）。
+        """
+        keys, positions = self._get_index(df, indexes, 'callnumber')
+        lo, hi = 0, len(keys)
+        if prefix:
+            prefix = _normalize_callnumber(prefix)
+            lo = max(lo, bisect.bisect_left(keys, prefix))
+            hi = min(hi, bisect.bisect_left(keys, prefix + '\uffff'))
+        if start:
+            lo = max(lo, bisect.bisect_left(keys, _normalize_callnumber(start)))
+        if end:
+            hi = min(hi, bisect.bisect_left(keys, _normalize_callnumber(end) + '\uffff'))
+        return positions[lo:max(lo, hi)]
+
+    def browse_by_callnumber(self, prefix=None, start=None, end=None, limit=15, offset=0):
+        """按书架顺序（索书号）浏览某一分类号或分类号区间内的图书，直接在索引上分页。
+
+        Returns:
+            tuple: (当前页的DataFrame, 区间内的总条数)
+        """
+        df, indexes = self._read_view()
+        if df.empty:
+            return pd.DataFrame(columns=self.columns), 0
+        positions = self._callnumber_range(df, indexes, prefix, start, end)
+        return df.iloc[positions[offset:offset + limit]], len(positions)
+
+    def search_books(self, conditions, limit=15, offset=0, sort_by='id', include_score=False, corpus_stats=None):
+        """按条件查询图书。
+
+        Args:
+            conditions (dict): 查询条件，如 bookname、author、publishdepartment、year、month，
+                以及索书号前缀 callnumber 和索书号区间 callnumber_from/callnumber_to。
+            limit (int): 每页条数。
+            offset (int): 起始偏移量。
+            sort_by (str): 'id' 按入库顺序；'relevance' 按与书名/作者/出版社关键词的相关度排序。
+            include_score (bool): 按相关度排序时，是否在结果中附加 score 列（合并多个目录的结果时使用）。
+            corpus_stats (dict): 按相关度排序时使用的词频统计（见 relevance_stats），默认按本目录计算；
+                联合查询时传入所有目录汇总后的统计，使各目录的得分可以直接比较。
+
+        Returns:
+            tuple: (当前页的DataFrame, 符合条件的总条数)
+        """
         print(f"[DEBUG] search_books: Received conditions: {conditions}") # DEBUG
         # self._load_data() # Usually not needed if df is a class member and updated, but for safety:
-        self.df = self._load_data() # Force reload to ensure latest data for searching
+        df, indexes = self._read_view() # Force reload to ensure latest data for searching
 
-        if self.df.empty:
+        if df.empty:
             print("[DEBUG] search_books: DataFrame is empty. Returning no results.") #DEBUG
             return pd.DataFrame(columns=self.columns), 0
-            
-        # Start with non-deleted books
-        print(f"[DEBUG] search_books: Initial DataFrame shape before any filtering: {self.df.shape}") # DEBUG
-        filtered_df = self.df[self.df['isdelete'] == 0].copy()
-        print(f"[DEBUG] search_books: Shape after (isdelete == 0) filter: {filtered_df.shape}") # DEBUG
-        if filtered_df.empty and not self.df[self.df['isdelete'] == 0].empty :
-             print("[DEBUG] search_books: All books are marked as deleted or isdelete column issue.")
 
+        # Work on row positions instead of filtered copies of the frame: every predicate only
+        # looks at the rows that survived the previous ones, and only the final page is materialized.
+        active_positions = np.flatnonzero(df['isdelete'].to_numpy() == 0)
+        positions = active_positions
+        print(f"[DEBUG] search_books: Active (isdelete == 0) rows: {len(positions)}") # DEBUG
+        callnumber_terms = {k: str(conditions.get(k) or '').strip() for k in ('callnumber', 'callnumber_from', 'callnumber_to')}
+        if any(callnumber_terms.values()):
+            # Index-backed, so it always runs first
+            positions = np.sort(self._callnumber_range(df, indexes, callnumber_terms['callnumber'], callnumber_terms['callnumber_from'], callnumber_terms['callnumber_to']))
+            print(f"[DEBUG] search_books: Rows after call number filter {callnumber_terms}: {len(positions)}") # DEBUG
 
-        if conditions.get('bookname'):
-            search_term = str(conditions['bookname']).strip()
-            if search_term:
-                print(f"[DEBUG] search_books: Filtering by bookname: '{search_term}'") # DEBUG
-                filtered_df = filtered_df[filtered_df['bookname'].str.contains(search_term, case=False, na=False)]
-                print(f"[DEBUG] search_books: Shape after bookname filter: {filtered_df.shape}") # DEBUG
-        
-        if conditions.get('author'):
-            search_term = str(conditions['author']).strip()
-            if search_term:
-                print(f"[DEBUG] search_books: Filtering by author: '{search_term}'") # DEBUG
-                # Let's see some sample authors from the filtered_df before this specific filter
-                if not filtered_df.empty:
-                    print(f"[DEBUG] Sample authors in current filtered_df (up to 5): {filtered_df['author'].unique()[:5]}")
-                
-                # Apply the filter
-                filtered_df = filtered_df[filtered_df['author'].str.contains(search_term, case=False, na=False)]
-                print(f"[DEBUG] search_books: Shape after author filter: {filtered_df.shape}") # DEBUG
-                if not filtered_df.empty:
-                    print(f"[DEBUG] search_books: Result head after author filter:\n{filtered_df.head()}")
-            
-        if conditions.get('publishdepartment'):
-            search_term = str(conditions['publishdepartment']).strip()
-            if search_term:
-                print(f"[DEBUG] search_books: Filtering by publishdepartment: '{search_term}'") # DEBUG
-                filtered_df = filtered_df[filtered_df['publishdepartment'].str.contains(search_term, case=False, na=False)]
-                print(f"[DEBUG] search_books: Shape after publishdepartment filter: {filtered_df.shape}") # DEBUG
-
-        search_year = conditions.get('year') or conditions.get('publishdate')
-        search_month = conditions.get('month')
-
-        if search_year:
-            year_str = str(search_year).strip()
-            if year_str:
-                print(f"[DEBUG] search_books: Filtering by year: '{year_str}'") # DEBUG
-                filtered_df['publishdate'] = filtered_df['publishdate'].astype(str) # Ensure string
-                filtered_df = filtered_df[filtered_df['publishdate'].str.startswith(f'{year_str}年', na=False)]
-                print(f"[DEBUG] search_books: Shape after year filter: {filtered_df.shape}") # DEBUG
-        
-        if search_month:
-            month_str = str(search_month).strip()
-            if month_str:
-                print(f"[DEBUG] search_books: Filtering by month: '{month_str}'") # DEBUG
-                pattern = f'年{month_str}月' 
-                filtered_df['publishdate'] = filtered_df['publishdate'].astype(str) # Ensure string
-                filtered_df = filtered_df[filtered_df['publishdate'].str.contains(pattern, na=False, regex=False)]
-                print(f"[DEBUG] search_books: Shape after month filter: {filtered_df.shape}") # DEBUG
-
-        total_count = len(filtered_df)
+        positions = self._evaluate_predicates(self._compile_predicates(df, indexes, conditions), positions)
+
+        total_count = len(positions)
         print(f"[DEBUG] search_books: Total count before pagination: {total_count}") # DEBUG
-        
-        paginated_df = filtered_df.sort_values(by='id', ascending=True).iloc[offset : offset + limit] #Ensure sorting by ID for consistent pagination
+
+        has_text_terms = any(str(conditions.get(field) or '').strip() for field in self.RELEVANCE_FIELD_WEIGHTS)
+        ids = df['id'].to_numpy()[positions]
+        if sort_by == 'relevance' and has_text_terms and total_count:
+            scores = self._relevance_scores(df, indexes, positions, active_positions, conditions, corpus_stats)
+        else:
+            scores = -ids.astype(float) # Smallest id ranks highest, so the page is the k smallest ids
+        page_order = _top_k_positions(scores, ids, offset + limit)[offset:]
+        paginated_df = df.iloc[positions[page_order]]
+        if include_score and sort_by == 'relevance' and has_text_terms:
+            paginated_df = paginated_df.assign(score=scores[page_order])
         print(f"[DEBUG] search_books: Shape after pagination: {paginated_df.shape}") # DEBUG
-        
+
         return paginated_df, total_count
 
+    def _compile_predicates(self, df, indexes, conditions):
+        """把查询条件编译成谓词列表 [(名称, 谓词)]。
+
+        谓词接收候选行在 df 中的位置数组，返回等长的布尔数组。
+        价格区间为 price_min/price_max，出版日期区间为 date_from/date_to
+        （可写 1990、1990-5 或 1990年5月，两端都包含）。
+        """
+        predicates = []
+
+        def contains(column, term):
+            return lambda positions: df[column].iloc[positions].str.contains(term, case=False, na=False).to_numpy()
+
+        for column in ('bookname', 'author', 'publishdepartment'):
+            search_term = str(conditions.get(column) or '').strip()
+            if search_term:
+                predicates.append((f"{column} contains '{search_term}'", contains(column, search_term)))
+
+        year_str = str(conditions.get('year') or conditions.get('publishdate') or '').strip()
+        if year_str:
+            predicates.append((f"year '{year_str}'", lambda positions: df['publishdate'].iloc[positions].str.startswith(f'{year_str}年', na=False).to_numpy()))
+        month_str = str(conditions.get('month') or '').strip()
+        if month_str:
+            pattern = f'年{month_str}月'
+            predicates.append((f"month '{month_str}'", lambda positions: df['publishdate'].iloc[positions].str.contains(pattern, na=False, regex=False).to_numpy()))
+
+        price_min, price_max = conditions.get('price_min'), conditions.get('price_max')
+        if _is_set(price_min) or _is_set(price_max):
+            try:
+                low = float(price_min) if _is_set(price_min) else -np.inf
+                high = float(price_max) if _is_set(price_max) else np.inf
+            except (TypeError, ValueError):
+                raise ValueError(f"无效的价格区间: {price_min} - {price_max}")
+            prices = df['price'].to_numpy(dtype=float, na_value=np.nan)
+            predicates.append((f"price in [{low}, {high}]", lambda positions, low=low, high=high: (prices[positions] >= low) & (prices[positions] <= high)))
+
+        date_from, date_to = conditions.get('date_from'), conditions.get('date_to')
+        if _is_set(date_from) or _is_set(date_to):
+            low = _parse_month_bound(date_from, is_end=False) if _is_set(date_from) else 0
+            high = _parse_month_bound(date_to, is_end=True) if _is_set(date_to) else np.iinfo(np.int64).max
+            publish_months = self._get_index(df, indexes, 'publish_month')
+            predicates.append((f"publishdate in [{low}, {high}]", lambda positions, low=low, high=high: (publish_months[positions] >= low) & (publish_months[positions] <= high)))
+        return predicates
+
+    def _evaluate_predicates(self, predicates, positions):
+        """依次应用谓词，结果为空时立即停止。
+
+        候选行较多且谓词不止一个时，先在均匀抽取的样本上估计每个谓词的通过率，
+        通过率最低（最有选择性）的先执行，后面的谓词只需检查更少的行。
+        """
+        if len(predicates) > 1 and len(positions) > 4 * self.SELECTIVITY_SAMPLE_SIZE:
+            sample = positions[np.linspace(0, len(positions) - 1, self.SELECTIVITY_SAMPLE_SIZE).astype(int)]
+            predicates = sorted(predicates, key=lambda predicate: predicate[1](sample).mean())
+        for name, predicate in predicates:
+            if len(positions) == 0:
+                break
+            positions = positions[predicate(positions)]
+            print(f"[DEBUG] search_books: Rows after {name}: {len(positions)}") # DEBUG
+        return positions
+
+    def relevance_stats(self, conditions):
+        """返回按相关度排序所需的词频统计，统计范围是本目录所有未删除的图书。
+
+        Returns:
+            dict: 字段 -> {'n_docs': 文档数, 'total_len': 总长度, 'doc_freq': {二元组: 包含它的文档数}}，
+                只包含 conditions 中有关键词的字段。多个目录的统计可以逐项相加。
+        """
+        df, indexes = self._read_view()
+        if df.empty:
+            return {}
+        return self._corpus_stats(df, indexes, np.flatnonzero(df['isdelete'].to_numpy() == 0), conditions)
+
+    def _lowercase_column(self, df, indexes, field):
+        """返回 df 中某一列转为小写后的文本，缓存在 indexes 中，数据变化时随索引一起失效。"""
+        key = ('lowercase', field)
+        if key not in indexes:
+            indexes[key] = df[field].astype(str).str.lower()
+        return indexes[key]
+
+    def _corpus_stats(self, df, indexes, corpus_positions, conditions):
+        """统计所有未删除的图书（``corpus_positions``）上的文档数、总长度和各二元组的文档频数。
+
+        统计结果缓存在 indexes 中，翻页或重复查询同一关键词时不必再扫描整个目录。
+        """
+        stats = {}
+        for field in self.RELEVANCE_FIELD_WEIGHTS:
+            term = str(conditions.get(field) or '').strip().lower()
+            if not term:
+                continue
+            lowercase = self._lowercase_column(df, indexes, field)
+            key = ('corpus_stats', field)
+            if key not in indexes:
+                indexes[key] = {'n_docs': len(corpus_positions),
+                                'total_len': float(lowercase.iloc[corpus_positions].str.len().sum()),
+                                'doc_freq': {}}
+            cached = indexes[key]
+            grams = set(_char_ngrams(term))
+            missing = [gram for gram in grams if gram not in cached['doc_freq']]
+            if missing:
+                corpus_values = lowercase.iloc[corpus_positions]
+                for gram in missing:
+                    cached['doc_freq'][gram] = int(corpus_values.str.contains(gram, regex=False).sum())
+            stats[field] = {'n_docs': cached['n_docs'], 'total_len': cached['total_len'],
+                            'doc_freq': {gram: cached['doc_freq'][gram] for gram in grams}}
+        return stats
+
+    def _relevance_scores(self, df, indexes, positions, corpus_positions, conditions, corpus_stats=None):
+        """计算候选行（``positions``）的相关度得分。
+
+        每个有关键词的字段得分 = 字符二元组上的BM25得分 + 命中位置越靠前越高的加分
+        + 完全相等的加分，再按 ``RELEVANCE_FIELD_WEIGHTS`` 加权求和。
+        词频统计（IDF、平均长度）默认基于所有未删除的图书 ``corpus_positions``，
+        也可以由调用方传入 ``corpus_stats``。
+        """
+        if corpus_stats is None:
+            corpus_stats = self._corpus_stats(df, indexes, corpus_positions, conditions)
+        k1, b = self.BM25_K1, self.BM25_B
+        scores = np.zeros(len(positions))
+        for field, weight in self.RELEVANCE_FIELD_WEIGHTS.items():
+            term = str(conditions.get(field) or '').strip().lower()
+            if not term:
+                continue
+            values = self._lowercase_column(df, indexes, field).iloc[positions]
+            field_stats = corpus_stats[field]
+            n_docs = field_stats['n_docs']
+            avg_len = max(field_stats['total_len'] / n_docs, 1.0) if n_docs else 1.0
+            lengths = values.str.len().to_numpy(dtype=float)
+
+            bm25 = np.zeros(len(positions))
+            for gram in set(_char_ngrams(term)):
+                doc_freq = field_stats['doc_freq'].get(gram, 0)
+                idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+                tf = values.str.count(re.escape(gram)).to_numpy(dtype=float)
+                bm25 += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / avg_len))
+
+            position = values.str.find(term).to_numpy(dtype=float)
+            position_bonus = np.where(position >= 0, 1.0 / (1.0 + position), 0.0)
+            exact_bonus = (values.str.strip() == term).to_numpy(dtype=float)
+            scores += weight * (bm25 + position_bonus + 2.0 * exact_bonus)
+        return scores
+
+    @_synchronized
     def add_book(self, book_data):
-        self.df = self._load_data() 
+        self._refresh_data()
+        self._make_writable()
 
         required_fields = ['bookorder', 'indexnumber', 'bookname', 'author', 'publishdepartment']
         for field in required_fields:
@@ -206,7 +816,7 @@ class BookDatabase:
 
 
         new_entry = {
-            'id': new_id,
+            'id': int(new_id),
             'bookorder': str(book_data['bookorder']).strip(),
             'indexnumber': str(book_data['indexnumber']).strip(),
             'bookname': str(book_data['bookname']).strip(),
@@ -217,21 +827,26 @@ class BookDatabase:
             'isdelete': 0
         }
         
+        self._commit('add', self._append_row(self.df, new_entry), row=new_entry)
+
+    def _append_row(self, df, new_entry):
+        """返回在 df 末尾追加一行新记录后的新DataFrame，并尽量保持原有列类型。"""
         new_row_df = pd.DataFrame([new_entry])
         # Ensure dtypes match before concat if df is not empty
-        if not self.df.empty:
-            for col in self.df.columns:
-                if col in new_row_df.columns and self.df[col].dtype != new_row_df[col].dtype:
+        if not df.empty:
+            for col in df.columns:
+                if col in new_row_df.columns and df[col].dtype != new_row_df[col].dtype:
                     try:
-                        new_row_df[col] = new_row_df[col].astype(self.df[col].dtype)
+                        new_row_df[col] = new_row_df[col].astype(df[col].dtype)
                     except Exception as e:
                         print(f"[WARN] add_book: Could not cast column {col} to match DataFrame dtype: {e}")
         
-        self.df = pd.concat([self.df, new_row_df], ignore_index=True)
-        self._save_data()
+        return pd.concat([df, new_row_df], ignore_index=True)
 
+    @_synchronized
     def update_book(self, book_id, book_data):
-        self.df = self._load_data() 
+        self._refresh_data()
+        self._make_writable()
         
         book_id = int(book_id) 
         idx_series = self.df[self.df['id'] == book_id].index
@@ -256,6 +871,7 @@ class BookDatabase:
         elif 'publishdate' in book_data and book_data['publishdate'] is None: 
             publishdate_str = "" # Use empty string for None
         
+        values = {}
         for col in self.df.columns:
             if col in book_data and col not in ['id', 'year', 'month', 'isdelete']: 
                 value = book_data[col]
@@ -264,39 +880,63 @@ class BookDatabase:
                 # Ensure value is stripped if it's a string field
                 if isinstance(value, str):
                     value = value.strip()
-                self.df.loc[idx, col] = value
+                values[col] = value
+        values['publishdate'] = str(publishdate_str)
         
-        self.df.loc[idx, 'publishdate'] = publishdate_str 
-        self._save_data()
+        new_df = self.df.copy() # Modified copy replaces self.df only once the change is persisted
+        for col, value in values.items():
+            new_df.loc[idx, col] = value
+        self._commit('update', new_df, id=book_id, values=values)
 
+    @_synchronized
     def delete_book(self, book_id):
-        self.df = self._load_data() 
+        self._refresh_data()
+        self._make_writable()
         book_id = int(book_id)
         idx = self.df[self.df['id'] == book_id].index
         if not idx.empty:
-            self.df.loc[idx, 'isdelete'] = 1
-            self._save_data()
+            new_df = self.df.copy()
+            new_df.loc[idx, 'isdelete'] = 1
+            self._commit('delete', new_df, id=book_id)
         else:
             raise ValueError(f"未找到ID为 {book_id} 的图书")
 
 
     def get_book_by_id(self, book_id):
-        self.df = self._load_data() 
+        df, _ = self._read_view()
         book_id = int(book_id)
+        ids = df['id']
         # Ensure 'id' column is of integer type for comparison if it's not already
-        if not pd.api.types.is_integer_dtype(self.df['id']):
-             self.df['id'] = pd.to_numeric(self.df['id'], errors='coerce').fillna(-1).astype(int)
+        if not pd.api.types.is_integer_dtype(ids):
+             ids = pd.to_numeric(ids, errors='coerce').fillna(-1).astype(int)
 
-        book_series_df = self.df[(self.df['id'] == book_id) & (self.df['isdelete'] == 0)]
+        book_series_df = df[(ids == book_id) & (df['isdelete'] == 0)]
         return book_series_df.iloc[0] if not book_series_df.empty else None
 
+    def get_books_by_ids(self, book_ids):
+        """批量按ID查询未删除的图书，只扫描一次数据。
+
+        Args:
+            book_ids (list): 图书ID列表。
+
+        Returns:
+            DataFrame: 找到的图书，按传入ID的顺序排列（重复ID只返回一次）。
+        """
+        df, _ = self._read_view()
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        if df.empty or not book_ids:
+            return pd.DataFrame(columns=self.columns)
+        found_df = df[df['id'].isin(book_ids) & (df['isdelete'] == 0)]
+        order = {book_id: position for position, book_id in enumerate(book_ids)}
+        return found_df.iloc[np.argsort(found_df['id'].map(order).to_numpy(), kind='stable')]
+
     def get_all_books(self, limit=15, offset=0):
-        self.df = self._load_data() 
+        df, _ = self._read_view()
         
-        if self.df.empty:
+        if df.empty:
             return pd.DataFrame(columns=self.columns), 0
             
-        active_books_df = self.df[self.df['isdelete'] == 0].copy()
+        active_books_df = df[df['isdelete'] == 0].copy()
         total_count = len(active_books_df)
         
         paginated_df = active_books_df.sort_values(by='id', ascending=True).iloc[offset : offset + limit]
@@ -0,0 +1,149 @@
+"""多个目录（各阅览室的CSV）的联合查询。
+
+FederatedBookDatabase 注册若干个目录，每个目录对应一个 BookDatabase。查询时在线程池中
+并行查询各目录，每个目录按相同的排序取出前 offset+limit 条，再合并成一个全局有序的页面，
+总数为各目录总数之和，每条结果带有 catalog 列标明来源。写操作需要指定写入哪个目录。
+
+接口与 BookDatabase 保持一致（search_books、get_all_books、browse_by_callnumber 等），
+页面代码只需换成 FederatedBookDatabase 即可。
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from database import BookDatabase, _normalize_callnumber
+
+# 参与联合查询的目录：名称 -> CSV文件，app.py 和 admin.py 共用。相对路径相对于页面所在目录。
+# 其他阅览室的目录在此追加，例如 "阅览室二": "bookCategory2.csv"
+CATALOG_FILES = {"资料室": "bookCategory.csv"}
+
+
+def catalog_paths(base_dir):
+    """把 CATALOG_FILES 解析为 名称 -> 绝对路径；base_dir 下没有该文件时退回当前工作目录。"""
+    paths = {}
+    for name, filename in CATALOG_FILES.items():
+        path = os.path.join(base_dir, filename)
+        if not os.path.exists(path) and not os.path.isabs(filename):
+            path = os.path.join(os.getcwd(), filename)
+        paths[name] = path
+    return paths
+
+
+class FederatedBookDatabase:
+    def __init__(self, max_workers=None):
+        """
+        Args:
+            max_workers (int): 并行查询的线程数，默认与目录数相同。
+        """
+        self.catalogs = {} # name -> BookDatabase, in registration order
+        self.max_workers = max_workers
+        self._pool = None
+
+    def register(self, name, csv_file_path, **kwargs):
+        """注册一个目录。kwargs 原样传给 BookDatabase（如 write_behind、shared_snapshot）。"""
+        if name in self.catalogs:
+            raise ValueError(f"目录 {name} 已注册")
+        self.catalogs[name] = BookDatabase(csv_file_path, **kwargs)
+        if self._pool is not None: # Resize on next use
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        return self.catalogs[name]
+
+    def catalog(self, name):
+        """按名称取得目录对应的 BookDatabase。"""
+        if name not in self.catalogs:
+            raise ValueError(f"未知的目录: {name}")
+        return self.catalogs[name]
+
+    def _map(self, call):
+        """在线程池中对每个目录执行 call(name, db)，按注册顺序返回结果。"""
+        if len(self.catalogs) == 1:
+            return [call(name, db) for name, db in self.catalogs.items()]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers or len(self.catalogs), thread_name_prefix="catalog-search")
+        futures = [self._pool.submit(call, name, db) for name, db in self.catalogs.items()]
+        return [future.result() for future in futures]
+
+    def _merge(self, results, limit, offset, sort_keys, ascending):
+        """合并各目录的 (页面, 总数)，按 sort_keys 全局排序后取出请求的那一页。"""
+        pages = []
+        for catalog_order, (name, (page_df, _)) in enumerate(zip(self.catalogs, results)):
+            if not page_df.empty:
+                pages.append(page_df.assign(catalog=name, _catalog_order=catalog_order))
+        total_count = sum(total for _, total in results)
+        if not pages:
+            return pd.DataFrame(columns=self.columns + ['catalog']), total_count
+        merged = pd.concat(pages, ignore_index=True)
+        merged = merged.sort_values(sort_keys + ['_catalog_order'], ascending=ascending + [True], kind='stable')
+        return merged.iloc[offset:offset + limit].drop(columns=['_catalog_order']), total_count
+
+    @property
+    def columns(self):
+        return next(iter(self.catalogs.values())).columns if self.catalogs else []
+
+    def _relevance_stats(self, conditions):
+        """汇总所有目录的词频统计，使各目录按同一份 IDF 和平均长度计算 BM25 得分。"""
+        merged = {}
+        for stats in self._map(lambda name, db: db.relevance_stats(conditions)):
+            for field, field_stats in stats.items():
+                total = merged.setdefault(field, {'n_docs': 0, 'total_len': 0.0, 'doc_freq': {}})
+                total['n_docs'] += field_stats['n_docs']
+                total['total_len'] += field_stats['total_len']
+                for gram, count in field_stats['doc_freq'].items():
+                    total['doc_freq'][gram] = total['doc_freq'].get(gram, 0) + count
+        return merged
+
+    def search_books(self, conditions, limit=15, offset=0, sort_by='id'):
+        """并行查询所有目录并合并结果。
+
+        按相关度排序时先汇总所有目录的词频统计，各目录按同一份统计打分后按得分合并，
+        否则按 id 合并；同分或同 id 时按目录注册顺序排列。
+        """
+        window = offset + limit
+        corpus_stats = self._relevance_stats(conditions) if sort_by == 'relevance' and len(self.catalogs) > 1 else None
+        results = self._map(lambda name, db: db.search_books(conditions, limit=window, offset=0, sort_by=sort_by,
+                                                             include_score=True, corpus_stats=corpus_stats))
+        if any('score' in page_df.columns for page_df, _ in results):
+            merged_df, total_count = self._merge(results, limit, offset, ['score', 'id'], [False, True])
+            return merged_df.drop(columns=['score'], errors='ignore'), total_count
+        return self._merge(results, limit, offset, ['id'], [True])
+
+    def get_all_books(self, limit=15, offset=0):
+        window = offset + limit
+        results = self._map(lambda name, db: db.get_all_books(limit=window, offset=0))
+        return self._merge(results, limit, offset, ['id'], [True])
+
+    def browse_by_callnumber(self, prefix=None, start=None, end=None, limit=15, offset=0):
+        window = offset + limit
+        results = self._map(lambda name, db: db.browse_by_callnumber(prefix=prefix, start=start, end=end, limit=window, offset=0))
+        keyed = [(page_df.assign(_shelf_key=page_df['indexnumber'].map(_normalize_callnumber)), total) for page_df, total in results]
+        merged_df, total_count = self._merge(keyed, limit, offset, ['_shelf_key', 'id'], [True, True])
+        return merged_df.drop(columns=['_shelf_key'], errors='ignore'), total_count
+
+    def get_book_by_id(self, book_id, catalog):
+        return self.catalog(catalog).get_book_by_id(book_id)
+
+    def get_books_by_ids(self, book_ids, catalog):
+        return self.catalog(catalog).get_books_by_ids(book_ids)
+
+    def add_book(self, book_data, catalog):
+        self.catalog(catalog).add_book(book_data)
+
+    def update_book(self, book_id, book_data, catalog):
+        self.catalog(catalog).update_book(book_id, book_data)
+
+    def delete_book(self, book_id, catalog):
+        self.catalog(catalog).delete_book(book_id)
+
+    def flush(self):
+        for db in self.catalogs.values():
+            if db.write_behind:
+                db.flush()
+
+    def close(self):
+        for db in self.catalogs.values():
+            db.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
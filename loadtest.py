@@ -0,0 +1,282 @@
+"""读者与管理员并发访问的压测工具。
+
+模拟 N 个读者会话同时在 app.py 中查询、翻页，同时一个管理员会话不断增、改、删图书，
+统计每种操作的延迟分位数（p50/p95/p99）、错误率、空结果率和“撕裂读”率（读到半个文件、
+总数与当前页条数对不上、基线有结果的查询突然查不到等），以及每个会话的CPU时间和内存峰值。
+
+每个会话是一个独立进程，因此CPU和内存可以按会话统计。压测在临时目录中的CSV和页面副本上进行，
+不会修改 bookCategory.csv。只复制页面和CSV：页面按自身所在目录读取CSV，而 database.py 等模块
+仍从源码目录导入，压测的是当前源码。
+
+读者有两种驱动方式:
+    --mode apptest  用 Streamlit 的 AppTest 运行 app.py，填写查询表单并点击翻页按钮（最接近真实使用）
+    --mode direct   像 app.py 一样每个进程用一个 FederatedBookDatabase 调用 search_books（只测数据层）
+管理员会话直接调用 FederatedBookDatabase 的 add_book/update_book/delete_book（随机选择一个目录）
+（admin.py 页面只提供添加功能，修改和删除没有界面）。
+
+用法:
+    python loadtest.py --sessions 8 --duration 60 --mode apptest --write-interval 0.5
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+import traceback
+
+import pandas as pd
+
+from federated_database import CATALOG_FILES, FederatedBookDatabase, catalog_paths
+from query_service_bench import _percentile
+
+PAGE_SIZE = 15 # 与 app.py 的 ITEMS_PER_PAGE 一致
+# 管理员会话只修改复制到临时目录的目录（CATALOG_FILES 中的相对路径），绝对路径的目录只读
+WRITABLE_CATALOGS = [name for name, filename in CATALOG_FILES.items() if not os.path.isabs(filename)]
+PAGE_FILES = ['app.py', 'admin.py'] # Modules are imported from the source tree, see the module docstring
+
+# 读者的查询，每条在原始目录中都有结果
+READER_QUERIES = [
+    {'bookname': '词典'}, {'bookname': '汉语'}, {'bookname': '语法'}, {'bookname': '方言'},
+    {'bookname': '语言学'}, {'author': '吕叔湘'}, {'author': '王力'}, {'publishdepartment': '商务印书馆'},
+    {'publishdepartment': '中华书局'}, {'bookname': '研究', 'publishdepartment': '出版社'},
+]
+# 查询条件 -> app.py 查询表单中输入框的key
+FORM_INPUT_KEYS = {'bookname': 'book_name_input', 'author': 'author_input', 'publishdepartment': 'publisher_input'}
+
+
+def _usage():
+    """当前进程的 (CPU秒数, 内存峰值MB)。"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024.0 # ru_maxrss is in KB on Linux
+
+
+def _check_page(page_len, total, offset, baseline_total):
+    """判断一次查询结果是否为空、是否不一致（撕裂读）。"""
+    expected_len = max(0, min(PAGE_SIZE, total - offset))
+    empty = total == 0
+    torn = page_len != expected_len or (empty and baseline_total > 0)
+    return empty, torn
+
+
+def _open_catalogs(workdir, shared_snapshot=False, **kwargs):
+    """像 app.py 一样按 CATALOG_FILES 打开临时目录中的各个目录副本。"""
+    db = FederatedBookDatabase()
+    for index, (name, csv_path) in enumerate(catalog_paths(workdir).items()):
+        shared_dir = os.path.join(workdir, f'shared-{index}') if shared_snapshot else None
+        db.register(name, csv_path, shared_snapshot=shared_snapshot, shared_dir=shared_dir, **kwargs)
+    return db
+
+
+class _DirectReader:
+    """按 app.py 的方式驱动数据层：每个进程一个 FederatedBookDatabase，每次交互调用一次 search_books。"""
+
+    def __init__(self, workdir, shared_snapshot=False):
+        self.db = _open_catalogs(workdir, shared_snapshot=shared_snapshot)
+        self.conditions = {}
+        self.page = 1
+        self.total = 0
+
+    def _query(self):
+        offset = (self.page - 1) * PAGE_SIZE
+        results_df, self.total = self.db.search_books(self.conditions, limit=PAGE_SIZE, offset=offset, sort_by='relevance')
+        return len(results_df), self.total, offset
+
+    def search(self, conditions):
+        self.conditions, self.page = conditions, 1
+        return self._query()
+
+    def next_page(self):
+        if self.page >= math.ceil(self.total / PAGE_SIZE):
+            return None
+        self.page += 1
+        return self._query()
+
+
+class _AppTestReader:
+    """用 Streamlit AppTest 运行 app.py，像读者一样填写表单、点击“下一页”。"""
+
+    def __init__(self, workdir):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(os.path.join(workdir, 'app.py'), default_timeout=120).run()
+
+    def _result(self):
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+        state = self.at.session_state
+        offset = (state['current_page'] - 1) * PAGE_SIZE
+        return len(state['search_results']), state['total_results'], offset
+
+    def search(self, conditions):
+        for field, key in FORM_INPUT_KEYS.items():
+            self.at.text_input(key=key).input(conditions.get(field, ''))
+        next(b for b in self.at.button if b.label == "开始查询").click().run()
+        return self._result()
+
+    def next_page(self):
+        try:
+            button = self.at.button(key="app_next_page")
+        except KeyError:
+            return None
+        if button.disabled:
+            return None
+        button.click().run()
+        return self._result()
+
+
+def reader_session(session_index, workdir, mode, shared_snapshot, start_at, deadline, think_time, baseline, result_queue):
+    """读者会话：反复 查询 -> 翻0到3页，记录每次交互。"""
+    rng = random.Random(session_index)
+    samples = []
+    try:
+        reader = _AppTestReader(workdir) if mode == 'apptest' else _DirectReader(workdir, shared_snapshot)
+        time.sleep(max(0.0, start_at - time.time()))
+        cpu_start, _ = _usage()
+        while time.time() < deadline:
+            query = rng.choice(READER_QUERIES)
+            query_key = repr(sorted(query.items()))
+            actions = [('search', lambda: reader.search(dict(query)))]
+            actions += [('next_page', reader.next_page)] * min(3, int(rng.expovariate(1.0)))
+            for kind, action in actions:
+                started = time.perf_counter()
+                try:
+                    outcome = action()
+                except Exception as e:
+                    samples.append((kind, time.perf_counter() - started, False, False, False, f"{type(e).__name__}: {e}"))
+                    break
+                elapsed = time.perf_counter() - started
+                if outcome is None: # Already on the last page
+                    break
+                empty, torn = _check_page(*outcome, baseline.get(query_key, 0))
+                samples.append((kind, elapsed, True, empty, torn, None))
+                time.sleep(rng.uniform(0, think_time))
+        cpu_end, peak_mb = _usage()
+        result_queue.put(('reader', session_index, samples, cpu_end - cpu_start, peak_mb, None))
+    except Exception:
+        result_queue.put(('reader', session_index, samples, 0.0, _usage()[1], traceback.format_exc()))
+
+
+def writer_session(workdir, write_behind, start_at, deadline, write_interval, result_queue):
+    """管理员会话：按固定间隔随机 添加/修改/删除 图书。"""
+    rng = random.Random(-1)
+    samples = []
+    try:
+        db = _open_catalogs(workdir, write_behind=write_behind)
+        max_ids = {name: int(db.catalog(name).df['id'].max()) for name in WRITABLE_CATALOGS}
+        time.sleep(max(0.0, start_at - time.time()))
+        cpu_start, _ = _usage()
+        while time.time() < deadline:
+            kind = rng.choices(['add', 'update', 'delete'], weights=[5, 3, 2])[0]
+            catalog = rng.choice(WRITABLE_CATALOGS)
+            started = time.perf_counter()
+            try:
+                if kind == 'add':
+                    db.add_book({
+                        'bookorder': f"LT{rng.randint(0, 10**6)}", 'indexnumber': 'H1/LT', 'bookname': '压测图书',
+                        'author': '压测', 'publishdepartment': '压测出版社', 'price': 10.0, 'year': 2020, 'month': 1,
+                    }, catalog=catalog)
+                elif kind == 'update':
+                    db.update_book(rng.randint(1, max_ids[catalog]), {'price': round(rng.uniform(1, 100), 2)}, catalog=catalog)
+                else:
+                    db.delete_book(rng.randint(1, max_ids[catalog]), catalog=catalog)
+                samples.append((kind, time.perf_counter() - started, True, False, False, None))
+            except ValueError:
+                samples.append((kind, time.perf_counter() - started, True, False, False, None)) # Book already gone
+            except Exception as e:
+                samples.append((kind, time.perf_counter() - started, False, False, False, f"{type(e).__name__}: {e}"))
+            time.sleep(write_interval)
+        db.close()
+        cpu_end, peak_mb = _usage()
+        result_queue.put(('writer', 0, samples, cpu_end - cpu_start, peak_mb, None))
+    except Exception:
+        result_queue.put(('writer', 0, samples, 0.0, _usage()[1], traceback.format_exc()))
+
+
+def _prepare_workdir(source_dir):
+    """把CSV和页面复制到临时目录，压测只修改副本。"""
+    workdir = tempfile.mkdtemp(prefix="books-loadtest-")
+    for name in PAGE_FILES + [CATALOG_FILES[catalog] for catalog in WRITABLE_CATALOGS]:
+        shutil.copy2(os.path.join(source_dir, name), os.path.join(workdir, name))
+    return workdir
+
+
+def _baseline_totals(workdir):
+    db = _open_catalogs(workdir)
+    return {repr(sorted(q.items())): db.search_books(q, limit=0)[1] for q in READER_QUERIES}
+
+
+def run_load_test(sessions, duration, mode, write_interval, think_time, write_behind, source_dir, shared_snapshot=False):
+    """运行压测，返回 (按操作汇总的DataFrame, 按会话汇总的DataFrame, 错误信息列表)。"""
+    workdir = _prepare_workdir(source_dir)
+    try:
+        baseline = _baseline_totals(workdir)
+        ctx = multiprocessing.get_context('spawn')
+        result_queue = ctx.Queue()
+        start_at = time.time() + (15.0 if mode == 'apptest' else 3.0) # Let every session finish start-up first
+        deadline = start_at + duration
+        processes = [ctx.Process(target=reader_session, args=(i, workdir, mode, shared_snapshot, start_at, deadline, think_time, baseline, result_queue))
+                     for i in range(sessions)]
+        if write_interval > 0:
+            processes.append(ctx.Process(target=writer_session, args=(workdir, write_behind, start_at, deadline, write_interval, result_queue)))
+        for process in processes:
+            process.start()
+        results = [result_queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rows, session_rows, failures = [], [], []
+    for role, index, samples, cpu_seconds, peak_mb, failure in results:
+        session_rows.append({'role': role, 'session': index, 'interactions': len(samples),
+                             'cpu_s': cpu_seconds, 'peak_rss_mb': peak_mb})
+        if failure:
+            failures.append(f"{role} #{index}:\n{failure}")
+        for kind, elapsed, ok, empty, torn, error in samples:
+            rows.append({'role': role, 'interaction': kind, 'seconds': elapsed, 'ok': ok, 'empty': empty, 'torn': torn})
+            if error and len(failures) < 20:
+                failures.append(f"{role} #{index} {kind}: {error}")
+
+    samples_df = pd.DataFrame(rows, columns=['role', 'interaction', 'seconds', 'ok', 'empty', 'torn'])
+    summary = []
+    for (role, kind), group in samples_df.groupby(['role', 'interaction']):
+        latencies = sorted(group['seconds'])
+        summary.append({
+            'role': role, 'interaction': kind, 'count': len(group),
+            'p50_ms': _percentile(latencies, 0.50) * 1000, 'p95_ms': _percentile(latencies, 0.95) * 1000,
+            'p99_ms': _percentile(latencies, 0.99) * 1000,
+            'error_rate': 1 - group['ok'].mean(), 'empty_rate': group['empty'].mean(), 'torn_rate': group['torn'].mean(),
+        })
+    return pd.DataFrame(summary), pd.DataFrame(session_rows), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="读者与管理员并发访问压测")
+    parser.add_argument('--sessions', type=int, default=4, help="并发读者会话数")
+    parser.add_argument('--duration', type=float, default=30.0, help="压测时长（秒）")
+    parser.add_argument('--mode', choices=['apptest', 'direct'], default='apptest', help="读者的驱动方式")
+    parser.add_argument('--write-interval', type=float, default=0.5, help="管理员两次修改之间的间隔（秒），0 表示不写")
+    parser.add_argument('--think-time', type=float, default=0.5, help="读者两次操作之间的最长思考时间（秒）")
+    parser.add_argument('--sync-writes', action='store_true', help="管理员会话不使用延迟写入模式")
+    parser.add_argument('--shared-snapshot', action='store_true', help="direct 模式下读者使用多进程共享快照")
+    args = parser.parse_args()
+
+    source_dir = os.path.dirname(os.path.realpath(__file__))
+    summary, per_session, failures = run_load_test(
+        args.sessions, args.duration, args.mode, args.write_interval, args.think_time,
+        not args.sync_writes, source_dir, shared_snapshot=args.shared_snapshot)
+
+    with pd.option_context('display.width', 160, 'display.max_columns', None, 'display.float_format', '{:.3f}'.format):
+        print("\n=== 各操作延迟与错误率 ===")
+        print(summary.to_string(index=False) if not summary.empty else "（没有完成任何操作）")
+        print("\n=== 各会话CPU与内存 ===")
+        print(per_session.sort_values(['role', 'session']).to_string(index=False))
+    for failure in failures:
+        print(f"[WARN] {failure}")
+
+
+if __name__ == "__main__":
+    main()
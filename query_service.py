@@ -0,0 +1,229 @@
+"""图书查询 HTTP/JSON 服务。
+
+不经过 Streamlit 页面，直接用一个常驻的 FederatedBookDatabase 实例回答查询请求，
+供 OPAC 查询机和脚本调用。只提供查询，不提供增删改。默认服务 federated_database.CATALOG_FILES
+中登记的所有目录（与 app.py 相同），也可以用 --catalog 名称=CSV路径 指定。
+
+启动:
+    python query_service.py --port 8765 --workers 32
+
+每个保持连接（keep-alive）的客户端在连接存续期间占用一个工作线程，因此 --workers 应不少于
+同时连接的查询机和脚本数；空闲超过 --idle-timeout 秒的连接会被关闭，把线程让给其他客户端。
+BookDatabase 的读操作只在刷新数据时短暂持锁，查询计算在锁外进行，多个工作线程可以同时查询
+（纯计算部分仍受 GIL 限制，需要更高吞吐量时可在多个进程中各启动一个服务）。
+
+接口:
+    GET  /health                              服务状态和在架图书数
+    GET  /books?limit=15&offset=0             按入库顺序分页浏览
+    GET  /books/search?bookname=词典&sort_by=relevance&limit=15&offset=0
+                                              条件查询（bookname/author/publishdepartment/year/month/callnumber/callnumber_from/callnumber_to/
+                                              price_min/price_max/date_from/date_to）
+    GET  /books/shelf?prefix=H164 或 ?from=H1&to=H2&limit=15&offset=0
+                                              按索书号书架顺序浏览
+    GET  /books/<id>?catalog=资料室            按ID查询单本图书
+    POST /books/lookup  {"ids": [1, 2, 3], "catalog": "资料室"}
+                                              批量按ID查询
+    各目录的ID各自编号，按ID查询时需要用 catalog 指明目录（只有一个目录时可省略）；
+    列表和查询结果中每条记录的 catalog 字段即其所在目录。
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from federated_database import FederatedBookDatabase, catalog_paths
+
+try:
+    current_dir = os.path.dirname(os.path.realpath(__file__))
+except NameError:
+    current_dir = os.getcwd()
+
+DEFAULT_LIMIT = 15
+MAX_LIMIT = 200 # 单次最多返回的条数，防止一次请求拉走整个目录
+MAX_LOOKUP_IDS = 1000
+DEFAULT_WORKERS = 32
+IDLE_TIMEOUT = 5.0 # 保持连接空闲多少秒后关闭，避免空闲连接长期占用工作线程
+SEARCH_FIELDS = ['bookname', 'author', 'publishdepartment', 'year', 'month',
+                 'callnumber', 'callnumber_from', 'callnumber_to',
+                 'price_min', 'price_max', 'date_from', 'date_to']
+
+
+def _records(df):
+    """把DataFrame转换成可JSON序列化的字典列表（NaN转为null）。"""
+    return json.loads(df.to_json(orient='records', force_ascii=False))
+
+
+class PooledHTTPServer(HTTPServer):
+    """用固定大小的线程池处理连接的HTTPServer，避免每个请求新建线程。"""
+
+    def __init__(self, server_address, handler_class, db, workers=DEFAULT_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.db = db
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-worker")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request_in_pool, request, client_address)
+
+    def _process_request_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so clients can reuse connections at high QPS
+    # Headers and body go out in separate writes; with Nagle on, a reused connection stalls ~40 ms on delayed ACK
+    disable_nagle_algorithm = True
+    timeout = IDLE_TIMEOUT # An idle keep-alive connection is closed and frees its worker thread
+    verbose = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split('/') if p]
+        try:
+            if parts == ['health']:
+                _, total = self.server.db.get_all_books(limit=0)
+                self._send_json(200, {'status': 'ok', 'books': total, 'catalogs': list(self.server.db.catalogs)})
+            elif parts == ['books']:
+                limit, offset = self._paging(params)
+                books_df, total = self.server.db.get_all_books(limit=limit, offset=offset)
+                self._send_json(200, {'total': total, 'limit': limit, 'offset': offset, 'books': _records(books_df)})
+            elif parts == ['books', 'search']:
+                self._handle_search(params)
+            elif parts == ['books', 'shelf']:
+                shelf_range = {k: params.get(k, '').strip() for k in ('prefix', 'from', 'to')}
+                if not any(shelf_range.values()):
+                    raise ValueError("请提供 prefix，或 from/to 索书号区间")
+                limit, offset = self._paging(params)
+                books_df, total = self.server.db.browse_by_callnumber(
+                    prefix=shelf_range['prefix'], start=shelf_range['from'], end=shelf_range['to'],
+                    limit=limit, offset=offset)
+                self._send_json(200, {'total': total, 'limit': limit, 'offset': offset, 'books': _records(books_df)})
+            elif len(parts) == 2 and parts[0] == 'books':
+                catalog = self._catalog(params.get('catalog'))
+                book = self.server.db.get_book_by_id(int(parts[1]), catalog)
+                if book is None:
+                    self._send_json(404, {'error': f"目录 {catalog} 中未找到ID为 {parts[1]} 的图书"})
+                else:
+                    self._send_json(200, {**_records(book.to_frame().T)[0], 'catalog': catalog})
+            else:
+                self._send_json(404, {'error': f"未知的接口: {url.path}"})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            print(f"[ERROR] query_service: {self.path}: {e}") # ERROR
+            self._send_json(500, {'error': str(e)})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path.rstrip('/') != '/books/lookup':
+                self._send_json(404, {'error': f"未知的接口: {url.path}"})
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("请求体需要是JSON对象，例如 {\"ids\": [1, 2, 3]}")
+            catalog = self._catalog(payload.get('catalog'))
+            ids = payload.get('ids')
+            if not isinstance(ids, list):
+                raise ValueError("请求体需要包含 ids 列表")
+            if len(ids) > MAX_LOOKUP_IDS:
+                raise ValueError(f"一次最多查询 {MAX_LOOKUP_IDS} 个ID")
+            ids = [int(book_id) for book_id in ids]
+            books = _records(self.server.db.get_books_by_ids(ids, catalog).assign(catalog=catalog))
+            found = {book['id'] for book in books}
+            self._send_json(200, {'books': books, 'missing': [i for i in ids if i not in found]})
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            print(f"[ERROR] query_service: {self.path}: {e}") # ERROR
+            self._send_json(500, {'error': str(e)})
+
+    def _handle_search(self, params):
+        conditions = {k: params[k].strip() for k in SEARCH_FIELDS if params.get(k, '').strip()}
+        if not conditions:
+            raise ValueError(f"请至少提供一个查询条件: {', '.join(SEARCH_FIELDS)}")
+        sort_by = params.get('sort_by', 'id')
+        if sort_by not in ('id', 'relevance'):
+            raise ValueError("sort_by 只能是 id 或 relevance")
+        limit, offset = self._paging(params)
+        books_df, total = self.server.db.search_books(conditions, limit=limit, offset=offset, sort_by=sort_by)
+        self._send_json(200, {'total': total, 'limit': limit, 'offset': offset, 'books': _records(books_df)})
+
+    def _catalog(self, name):
+        """按ID查询时所指的目录；只登记了一个目录时可以省略。"""
+        catalogs = list(self.server.db.catalogs)
+        if not name:
+            if len(catalogs) == 1:
+                return catalogs[0]
+            raise ValueError(f"请用 catalog 指明目录: {', '.join(catalogs)}")
+        if name not in catalogs:
+            raise ValueError(f"未知的目录: {name}（可选: {', '.join(catalogs)}）")
+        return name
+
+    def _paging(self, params):
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+        if not (0 <= limit <= MAX_LIMIT) or offset < 0:
+            raise ValueError(f"limit 需在 0 到 {MAX_LIMIT} 之间，offset 不能为负数")
+        return limit, offset
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图书查询 HTTP/JSON 服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="处理连接的线程数，应不少于同时连接的客户端数")
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, help="空闲连接多少秒后关闭")
+    parser.add_argument('--catalog', action='append', metavar='名称=CSV路径',
+                        help="要服务的目录，可重复指定；默认为 federated_database.CATALOG_FILES 中登记的目录")
+    parser.add_argument('--verbose', action='store_true', help="打印每个请求的访问日志")
+    args = parser.parse_args()
+
+    QueryRequestHandler.verbose = args.verbose
+    QueryRequestHandler.timeout = args.idle_timeout
+    if args.catalog:
+        if not all('=' in item for item in args.catalog):
+            parser.error("--catalog 的格式为 名称=CSV路径")
+        catalogs = dict(item.split('=', 1) for item in args.catalog)
+    else:
+        catalogs = catalog_paths(current_dir)
+    db = FederatedBookDatabase()
+    for catalog_name, csv_path in catalogs.items():
+        db.register(catalog_name, csv_path)
+    server = PooledHTTPServer((args.host, args.port), QueryRequestHandler, db, workers=args.workers)
+    print(f"[INFO] query_service: Serving {', '.join(f'{n}={p}' for n, p in catalogs.items())} on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
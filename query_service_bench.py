@@ -0,0 +1,123 @@
+"""query_service.py 的压测客户端。
+
+用多个线程（每个线程一个长连接）向查询服务发送混合请求（条件查询、翻页、按ID查询、
+批量查询），统计吞吐量（QPS）、延迟分位数和错误数。
+
+用法:
+    python query_service.py --port 8765 --workers 32 &  # workers 不少于 --concurrency
+    python query_service_bench.py --url http://127.0.0.1:8765 --concurrency 16 --requests 5000
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, quote
+
+SEARCH_TERMS = [
+    {'bookname': '词典'}, {'bookname': '汉语'}, {'bookname': '语法'}, {'bookname': '方言'},
+    {'author': '吕叔湘'}, {'author': '王力'}, {'publishdepartment': '商务印书馆'},
+    {'publishdepartment': '中华书局', 'year': '1982'}, {'bookname': '语言', 'year': '1990'},
+]
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _random_request(rng, max_id):
+    """随机生成一个 (method, path, body) 请求，模拟查询机的混合访问。"""
+    kind = rng.random()
+    if kind < 0.55:
+        conditions = dict(rng.choice(SEARCH_TERMS))
+        conditions['offset'] = 15 * rng.randint(0, 3)
+        conditions['sort_by'] = rng.choice(['id', 'relevance'])
+        query = '&'.join(f"{k}={quote(str(v))}" for k, v in conditions.items())
+        return 'GET', f"/books/search?{query}", None
+    if kind < 0.75:
+        return 'GET', f"/books?limit=15&offset={15 * rng.randint(0, 200)}", None
+    if kind < 0.95:
+        return 'GET', f"/books/{rng.randint(1, max_id)}", None
+    ids = [rng.randint(1, max_id) for _ in range(rng.randint(5, 50))]
+    return 'POST', "/books/lookup", json.dumps({'ids': ids})
+
+
+def run_benchmark(url, concurrency, total_requests, max_id, seed=0):
+    """并发发送请求，返回统计结果字典。"""
+    target = urlsplit(url)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker(worker_index):
+        rng = random.Random(seed + worker_index)
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        local_latencies, local_errors = [], []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            method, path, body = _random_request(rng, max_id)
+            headers = {'Content-Type': 'application/json'} if body else {}
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500 or (response.status >= 400 and response.status != 404):
+                    local_errors.append(f"{response.status} {method} {path}")
+            except (OSError, http.client.HTTPException) as e:
+                local_errors.append(f"{type(e).__name__} {method} {path}")
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+            local_latencies.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'elapsed_s': elapsed,
+        'qps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图书查询服务压测客户端")
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--concurrency', type=int, default=8, help="并发连接数")
+    parser.add_argument('--requests', type=int, default=2000, help="请求总数")
+    parser.add_argument('--max-id', type=int, default=27000, help="按ID查询时随机ID的上限")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stats = run_benchmark(args.url, args.concurrency, args.requests, args.max_id, seed=args.seed)
+    print(f"请求数: {stats['requests']}  错误数: {stats['errors']}  耗时: {stats['elapsed_s']:.2f}s")
+    print(f"吞吐量: {stats['qps']:.1f} req/s")
+    print(f"延迟: p50={stats['p50_ms']:.1f}ms  p95={stats['p95_ms']:.1f}ms  "
+          f"p99={stats['p99_ms']:.1f}ms  max={stats['max_ms']:.1f}ms")
+    for sample in stats['error_samples']:
+        print(f"[WARN] {sample}")
+
+
+if __name__ == "__main__":
+    main()
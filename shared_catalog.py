@@ -0,0 +1,107 @@
+"""多个进程共享的只读目录快照。
+
+多个 Streamlit 进程部署在同一台机器上时，每个进程各自持有一份 pandas 数据会让内存随进程数线性增长。
+启用共享模式后，目录数据以 Arrow IPC 文件（列式、不压缩）发布到 /dev/shm（没有时放在CSV旁边），
+每次发布产生一个新的代号（generation），由 CURRENT 文件指向最新代号。读者进程用内存映射打开快照，
+字符串列和数值列都直接引用映射的内存，不复制，因此所有进程共用同一份物理内存；发现 CURRENT
+指向新代号时整体切换到新快照。旧代号的文件在发布两代之后删除，仍在使用它的进程不受影响
+（文件删除后映射依然有效）。
+
+需要 pyarrow（Streamlit 的依赖，已随 Streamlit 安装）。
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+_STRING_DTYPE = pd.StringDtype('pyarrow', na_value=np.nan) # Same dtype _load_data produces for text columns
+
+
+class SharedCatalog:
+    def __init__(self, csv_file_path, shared_dir=None):
+        """
+        Args:
+            csv_file_path (str): 目录CSV文件路径，用于确定默认的共享目录。
+            shared_dir (str): 存放快照的目录，默认为 /dev/shm/books-<CSV路径的哈希>。
+        """
+        if shared_dir is None:
+            digest = hashlib.sha1(os.path.realpath(csv_file_path).encode('utf-8')).hexdigest()[:12]
+            shared_dir = f"/dev/shm/books-{digest}" if os.path.isdir('/dev/shm') else f"{csv_file_path}.shared"
+        self.shared_dir = shared_dir
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self.current_path = os.path.join(self.shared_dir, 'CURRENT')
+
+    def _generation_path(self, generation):
+        return os.path.join(self.shared_dir, f"gen-{generation:08d}.arrow")
+
+    def current(self):
+        """返回 (最新代号, 发布时CSV的签名)，尚未发布过时返回 (None, None)。"""
+        try:
+            with open(self.current_path, 'r', encoding='utf-8') as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        return current['generation'], tuple(current['csv_signature'])
+
+    @contextlib.contextmanager
+    def publish_lock(self):
+        """跨进程的发布锁，避免多个进程同时为同一份CSV发布快照。"""
+        with open(os.path.join(self.shared_dir, 'publish.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, df, csv_signature):
+        """把DataFrame发布为新一代快照，返回新代号。调用方应持有 publish_lock。"""
+        arrays, fields = [], []
+        for name in df.columns:
+            column = df[name]
+            if pd.api.types.is_numeric_dtype(column.dtype):
+                values = column.to_numpy(dtype=np.float64 if name == 'price' else np.int64, na_value=np.nan if name == 'price' else 0)
+                # from_pandas=False keeps NaN prices as NaN rather than nulls, so readers can map them without a copy
+                arrays.append(pa.array(values, from_pandas=False))
+            else:
+                # pandas keeps Arrow-backed strings as large_string; storing that type avoids a cast (copy) on read
+                arrays.append(pa.array(column.astype(object), type=pa.large_string(), from_pandas=True))
+            fields.append(pa.field(name, arrays[-1].type))
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+        previous, _ = self.current()
+        generation = (previous or 0) + 1
+        path = self._generation_path(generation)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        tmp_current = f"{self.current_path}.{os.getpid()}.tmp"
+        with open(tmp_current, 'w', encoding='utf-8') as f:
+            json.dump({'generation': generation, 'csv_signature': list(csv_signature)}, f)
+        os.replace(tmp_current, self.current_path) # Readers switch generations atomically here
+
+        for name in os.listdir(self.shared_dir):
+            if name.startswith('gen-') and name.endswith('.arrow') and int(name[4:12]) < generation - 1:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.shared_dir, name))
+        print(f"[DEBUG] SharedCatalog: Published generation {generation} ({len(df)} rows) to {path}") # DEBUG
+        return generation
+
+    def open(self, generation):
+        """以内存映射方式打开某一代快照，返回引用共享内存的只读DataFrame。"""
+        table = pa.ipc.open_file(pa.memory_map(self._generation_path(generation), 'r')).read_all()
+        columns = {}
+        for name in table.column_names:
+            column = table.column(name)
+            if pa.types.is_large_string(column.type):
+                columns[name] = pd.Series(pd.array(column, dtype=_STRING_DTYPE), copy=False)
+            else:
+                columns[name] = pd.Series(column.to_numpy(), copy=False)
+        return pd.DataFrame(columns, copy=False)